@@ -1,37 +1,249 @@
 import os
+import re
 import json
+import time
+import random
+import threading
 import streamlit as st
-try:
-    from langchain_community.chat_models import ChatYandexGPT
-    from langchain_core.prompts import PromptTemplate
-except ImportError:
-    pass 
 from dotenv import load_dotenv
 
 # 1. Принудительно загружаем .env
 load_dotenv()
 
-def get_llm(temp=0.1):
+# --- НАСТРОЙКИ ШЛЮЗА YANDEXGPT ---
+API_URL = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
+DEFAULT_MODEL = "yandexgpt/latest"
+REQUEST_TIMEOUT = float(os.getenv("YANDEX_GPT_TIMEOUT", "60"))  # секунд на одну попытку (таймаут сокета)
+CALL_TIMEOUT = float(os.getenv("YANDEX_GPT_DEADLINE", "90"))  # секунд на весь вызов: очередь, повторы, поток
+MAX_RETRIES = int(os.getenv("YANDEX_GPT_RETRIES", "4"))
+RATE_LIMIT_RPS = float(os.getenv("YANDEX_GPT_RPS", "10"))  # квота синхронных запросов к YandexGPT
+RATE_LIMIT_BURST = int(os.getenv("YANDEX_GPT_BURST", "10"))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 20.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class AIError(Exception):
+    """Запрос к YandexGPT не удался. Текст ошибки не должен попадать в документы."""
+
+    def __init__(self, message, status=None, retryable=False):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+
+
+class TokenBucket:
+    """Ограничитель частоты запросов: rate токенов в секунду, не больше capacity подряд."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                raise AIError("Превышено время ожидания лимита запросов YandexGPT", retryable=True)
+            time.sleep(wait)
+
+
+# Квота общая на каталог, поэтому ограничитель один на все клиенты
+_rate_limiter = TokenBucket(RATE_LIMIT_RPS, RATE_LIMIT_BURST)
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Экспоненциальная задержка с полным джиттером; Retry-After сервера имеет приоритет."""
+    if retry_after:
+        try: return min(BACKOFF_MAX, float(retry_after))
+        except ValueError: pass
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def _remaining(deadline):
+    """Сколько секунд осталось до дедлайна вызова; если нисколько - AIError."""
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise AIError("Превышено время ожидания ответа YandexGPT", retryable=True)
+    return left
+
+
+def _iter_body(resp, deadline):
+    """Куски тела ответа по мере поступления (read1 не ждет заполнения буфера), с проверкой дедлайна."""
+    while True:
+        _remaining(deadline)
+        chunk = resp.raw.read1(8192, decode_content=True)
+        if not chunk: return
+        yield chunk
+
+
+def _iter_lines(resp, deadline):
+    buf = b""
+    for chunk in _iter_body(resp, deadline):
+        *lines, buf = (buf + chunk).split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8").strip()
+    if buf.strip():
+        yield buf.decode("utf-8").strip()
+
+
+class LLMClient:
+    """Клиент YandexGPT с постоянным HTTP-пулом соединений. Один на (модель, температура)."""
+
+    def __init__(self, api_key, folder_id, model=DEFAULT_MODEL, temperature=0.1, url=None):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.url = url or api_url()
+        self.folder_id = folder_id
+        self.model_uri = f"gpt://{folder_id}/{model}"
+        self.temperature = temperature
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=8))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=8))
+        self.session.headers.update({
+            "Authorization": f"Api-Key {api_key}",
+            "x-folder-id": folder_id,
+        })
+
+    def _payload(self, prompt, max_tokens, stream=False):
+        return {
+            "modelUri": self.model_uri,
+            "completionOptions": {
+                "stream": stream,
+                "temperature": self.temperature,
+                "maxTokens": str(max_tokens),
+            },
+            "messages": [{"role": "user", "text": prompt}],
+        }
+
+    def _post(self, payload, deadline, stream=False):
+        """POST с ограничением частоты и повторами на 429/5xx и сетевых ошибках, не дольше deadline."""
+        import requests
+
+        last_error = None
+        for attempt in range(MAX_RETRIES + 1):
+            _rate_limiter.acquire(timeout=_remaining(deadline))
+            try:
+                resp = self.session.post(self.url, json=payload, timeout=min(REQUEST_TIMEOUT, _remaining(deadline)),
+                                         stream=stream)
+            except requests.RequestException as e:
+                last_error = AIError(f"Нет связи с YandexGPT: {e}", retryable=True)
+                retry_after = None
+            else:
+                if resp.status_code == 200:
+                    return resp
+                last_error = AIError(f"YandexGPT ответил {resp.status_code}: {resp.text[:300]}",
+                                     status=resp.status_code,
+                                     retryable=resp.status_code in RETRY_STATUSES)
+                retry_after = resp.headers.get("Retry-After")
+                resp.close()
+            if not last_error.retryable or attempt == MAX_RETRIES:
+                break
+            delay = backoff_delay(attempt, retry_after)
+            # Повтор не успеет до дедлайна - отдаем последнюю ошибку сразу, а не после сна
+            if time.monotonic() + delay >= deadline:
+                break
+            time.sleep(delay)
+        raise last_error
+
+    def complete(self, prompt, max_tokens=2000, timeout=CALL_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        # Тело читаем потоком: медленно капающий ответ не продлевает вызов за дедлайн
+        resp = self._post(self._payload(prompt, max_tokens), deadline, stream=True)
+        try:
+            body = b"".join(_iter_body(resp, deadline))
+            return json.loads(body)["result"]["alternatives"][0]["message"]["text"]
+        except AIError:
+            raise
+        except (ValueError, KeyError, IndexError) as e:
+            raise AIError(f"Неожиданный ответ YandexGPT: {e}")
+        except Exception as e:
+            raise AIError(f"Обрыв ответа YandexGPT: {e}", retryable=True)
+        finally:
+            resp.close()
+
+    def stream(self, prompt, max_tokens=2000, timeout=CALL_TIMEOUT):
+        """Отдает накопленный текст ответа по мере генерации, весь вызов - не дольше timeout секунд.
+
+        Если потребитель прекращает итерацию, соединение закрывается и генерация обрывается.
+        """
+        deadline = time.monotonic() + timeout
+        resp = self._post(self._payload(prompt, max_tokens, stream=True), deadline, stream=True)
+        text = ""
+        try:
+            for line in _iter_lines(resp, deadline):
+                if not line: continue
+                if line.startswith("data:"): line = line[5:].strip()
+                try:
+                    chunk = json.loads(line)["result"]["alternatives"][0]["message"]["text"]
+                except (ValueError, KeyError, IndexError) as e:
+                    raise AIError(f"Неожиданный ответ YandexGPT: {e}")
+                # YandexGPT присылает весь текст с начала, но на всякий случай поддерживаем и дельты
+                text = chunk if chunk.startswith(text) else text + chunk
+                yield text
+        except AIError:
+            raise
+        except Exception as e:
+            raise AIError(f"Обрыв потока YandexGPT: {e}", retryable=True)
+        finally:
+            resp.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def api_url():
+    # Адрес можно переопределить (например, на локальную заглушку: python benchmark.py gateway).
+    # Читается при создании клиента, а не при импорте модуля
+    return os.getenv("YANDEX_GPT_URL", API_URL)
+
+
+def get_credentials():
     # 2. Сначала ищем в .env (os.getenv)
     api_key = os.getenv("YANDEX_API_KEY")
     folder_id = os.getenv("YANDEX_FOLDER_ID")
 
     # 3. Если в .env пусто, пробуем поискать в secrets (на случай если когда-то выложим в сеть)
     if not api_key and hasattr(st, "secrets"):
-        api_key = st.secrets.get("YANDEX_API_KEY")
-        folder_id = st.secrets.get("YANDEX_FOLDER_ID")
+        try:
+            api_key = st.secrets.get("YANDEX_API_KEY")
+            folder_id = st.secrets.get("YANDEX_FOLDER_ID")
+        except Exception:
+            pass
+    return api_key, folder_id
 
+
+def get_llm(temp=0.1, model=DEFAULT_MODEL):
+    api_key, folder_id = get_credentials()
     if not api_key or not folder_id:
         # Если ключей нигде нет - вернем None, main.py покажет ошибку
         return None
 
-    return ChatYandexGPT(
-        api_key=api_key,
-        folder_id=folder_id,
-        model_uri=f"gpt://{folder_id}/yandexgpt/latest", 
-        temperature=temp,
-        max_tokens=7500
-    )
+    url = api_url()
+    key = (api_key, folder_id, model, temp, url)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = LLMClient(api_key, folder_id, model=model, temperature=temp, url=url)
+        return _clients[key]
+
+
+def require_llm(temp=0.1):
+    llm = get_llm(temp=temp)
+    if not llm: raise AIError("Нет ключей YandexGPT (YANDEX_API_KEY, YANDEX_FOLDER_ID)")
+    return llm
+
 
 def clean_json_response(content):
     content = content.strip()
@@ -43,53 +255,133 @@ def clean_json_response(content):
         content = content[start_idx : end_idx + 1]
     return content
 
+DUTIES_PROMPT = """
+Ты — HR-директор. Напиши 5-7 обязанностей для должности: {position}.
+Стиль: Строгий, официальный.
+Формат: Только маркированный список.
+"""
+
+EGRUL_PROMPT = """
+Ты — алгоритм обработки ЕГРЮЛ. Извлеки данные и ОТФОРМАТИРУЙ их.
+
+ВХОДНОЙ ТЕКСТ:
+{text}
+
+ИНСТРУКЦИЯ (СТРОГО):
+1. Преобразуй ВЕСЬ текст из CAPS LOCK в обычный (Title Case).
+2. Исключения (оставь большими): ООО, АО, ИНН, КПП, ОГРН.
+
+ВЕРНИ ТОЛЬКО JSON с ключами:
+- "opf": ОПФ (Например: "Общество с ограниченной ответственностью")
+- "name": Название без кавычек (Например: Альянс)
+- "short_name": Сокращенное наименование (Например: ООО "Альянс")
+- "inn": ИНН
+- "kpp": КПП (9 цифр)
+- "ogrn": ОГРН
+- "address": Адрес
+- "boss_name": ФИО директора
+- "boss_pos": Должность
+"""
+
 def generate_ai_duties(position: str) -> str:
-    try:
-        llm = get_llm(temp=0.6)
-        if not llm: return "Ошибка: Нет ключей YandexGPT"
-        template = """
-        Ты — HR-директор. Напиши 5-7 обязанностей для должности: {position}.
-        Стиль: Строгий, официальный.
-        Формат: Только маркированный список.
-        """
-        chain = PromptTemplate(input_variables=["position"], template=template) | llm
-        return chain.invoke({"position": position}).content
-    except Exception as e:
-        return f"Ошибка AI: {str(e)}"
-
-def extract_data_from_egrul(text: str) -> dict:
-    try:
-        llm = get_llm(temp=0.1)
-        if not llm: return None # Ключи не найдены
-
-        template = """
-        Ты — алгоритм обработки ЕГРЮЛ. Извлеки данные и ОТФОРМАТИРУЙ их.
-        
-        ВХОДНОЙ ТЕКСТ:
-        {text}
-        
-        ИНСТРУКЦИЯ (СТРОГО):
-        1. Преобразуй ВЕСЬ текст из CAPS LOCK в обычный (Title Case).
-        2. Исключения (оставь большими): ООО, АО, ИНН, КПП, ОГРН.
-        
-        ВЕРНИ ТОЛЬКО JSON с ключами:
-        - "opf": ОПФ (Например: "Общество с ограниченной ответственностью")
-        - "name": Название без кавычек (Например: Альянс)
-        - "short_name": Сокращенное наименование (Например: ООО "Альянс")
-        - "inn": ИНН
-        - "kpp": КПП (9 цифр)
-        - "ogrn": ОГРН
-        - "address": Адрес
-        - "boss_name": ФИО директора
-        - "boss_pos": Должность
-        """
-        
-        prompt = PromptTemplate(input_variables=["text"], template=template)
-        chain = prompt | llm
-        
-        response = chain.invoke({"text": text[:30000]})
-        return json.loads(clean_json_response(response.content))
-
-    except Exception as e:
-        print(f"Extraction Error: {e}")
-        return None
\ No newline at end of file
+    """Обязанности для должности. При сбое бросает AIError."""
+    llm = require_llm(temp=0.6)
+    return llm.complete(DUTIES_PROMPT.format(position=position), max_tokens=2000)
+
+# --- ПРОВЕРКА РЕКВИЗИТОВ ---
+
+def _checksum(digits, weights, mod=11):
+    return sum(int(d) * w for d, w in zip(digits, weights)) % mod % 10
+
+def validate_inn(inn):
+    if not re.fullmatch(r"\d{10}|\d{12}", inn): return "ИНН должен содержать 10 или 12 цифр"
+    if len(inn) == 10:
+        ok = _checksum(inn, [2, 4, 10, 3, 5, 9, 4, 6, 8]) == int(inn[9])
+    else:
+        ok = (_checksum(inn, [7, 2, 4, 10, 3, 5, 9, 4, 6, 8]) == int(inn[10])
+              and _checksum(inn, [3, 7, 2, 4, 10, 3, 5, 9, 4, 6, 8]) == int(inn[11]))
+    return None if ok else "Неверная контрольная сумма ИНН"
+
+def validate_kpp(kpp):
+    if not re.fullmatch(r"\d{4}[\dA-Z]{2}\d{3}", kpp): return "КПП должен содержать 9 цифр"
+    return None
+
+def validate_ogrn(ogrn):
+    if not re.fullmatch(r"\d{13}|\d{15}", ogrn): return "ОГРН должен содержать 13 цифр (ОГРНИП - 15)"
+    if len(ogrn) == 13: ok = int(ogrn[:12]) % 11 % 10 == int(ogrn[12])
+    else: ok = int(ogrn[:14]) % 13 % 10 == int(ogrn[14])
+    return None if ok else "Неверная контрольная цифра ОГРН"
+
+FIELD_VALIDATORS = {"inn": validate_inn, "kpp": validate_kpp, "ogrn": validate_ogrn}
+
+def validate_field(key, value):
+    """Текст ошибки для поля или None. Цифровые реквизиты нормализуются (без пробелов)."""
+    if key in FIELD_VALIDATORS:
+        return FIELD_VALIDATORS[key](re.sub(r"\s", "", str(value)))
+    return None
+
+# --- ПОТОКОВЫЙ РАЗБОР JSON ---
+
+EGRUL_FIELDS = ["opf", "name", "short_name", "inn", "kpp", "ogrn", "address", "boss_name", "boss_pos"]
+EGRUL_REQUIRED = ["name", "inn", "ogrn", "address", "boss_name"]
+# 9 коротких строковых полей: ~600 символов JSON, ~300 токенов. Запас - на длинный адрес и ОПФ
+EGRUL_MAX_TOKENS = 800
+# Сколько символов ждем начала JSON, прежде чем признать ответ испорченным
+JSON_START_LIMIT = 300
+
+# Завершенная пара "ключ": "строка" | число | null - значение закончено, если за ним идет , или }
+_JSON_PAIR = re.compile(r'"(\w+)"\s*:\s*(?:"((?:[^"\\]|\\.)*)"|(-?\d+)\s*[,}\n]|(null)\b)')
+
+def parse_partial_json(text):
+    """Поля, которые уже полностью пришли в недописанном JSON-объекте."""
+    start = text.find("{")
+    if start == -1: return {}
+    fields = {}
+    for m in _JSON_PAIR.finditer(text, start):
+        key, s_val, n_val, null = m.groups()
+        if s_val is not None:
+            try: fields[key] = json.loads(f'"{s_val}"')
+            except ValueError: fields[key] = s_val
+        elif n_val is not None:
+            fields[key] = n_val
+        else:
+            fields[key] = ""
+    return fields
+
+def extract_data_from_egrul(text: str, on_field=None) -> dict:
+    """Реквизиты из текста выписки ЕГРЮЛ с потоковым разбором ответа.
+
+    on_field(key, value, error) вызывается, как только поле пришло целиком; error - текст
+    ошибки проверки или None. Генерация останавливается, когда пришли все поля.
+    При сбое бросает AIError.
+    """
+    llm = require_llm(temp=0.1)
+    prompt = EGRUL_PROMPT.format(text=text[:30000])
+    data = {}
+    content = ""
+    for content in llm.stream(prompt, max_tokens=EGRUL_MAX_TOKENS):
+        if "{" not in content and len(content) > JSON_START_LIMIT:
+            raise AIError("AI ответил не в формате JSON")
+        for key, value in parse_partial_json(content).items():
+            if key in data or key not in EGRUL_FIELDS: continue
+            data[key] = value
+            if on_field: on_field(key, value, validate_field(key, value))
+        if all(k in data for k in EGRUL_FIELDS):
+            break  # остальное - закрывающая скобка; не ждем конца генерации
+
+    if not all(k in data for k in EGRUL_REQUIRED):
+        # Ответ мог прийти в неожиданном виде - последняя попытка разобрать целиком
+        try:
+            full = json.loads(clean_json_response(content))
+        except json.JSONDecodeError:
+            full = {}
+        if not isinstance(full, dict):
+            raise AIError("AI ответил не JSON-объектом")
+        for key, value in full.items():
+            if key in data or key not in EGRUL_FIELDS: continue
+            data[key] = "" if value is None else str(value)
+            if on_field: on_field(key, data[key], validate_field(key, data[key]))
+        missing = ", ".join(k for k in EGRUL_REQUIRED if k not in data)
+        if missing:
+            raise AIError(f"AI не вернул поля: {missing}")
+    return data
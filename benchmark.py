@@ -0,0 +1,410 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# Замеры производительности приложения.
+#   python benchmark.py startup   - профиль импорта (-X importtime) и время до отрисовки списка сотрудников
+#   python benchmark.py import    - загрузка базы сотрудников 100k / 1M строк: время и память
+#   python benchmark.py gateway   - шлюз YandexGPT против локальной заглушки: повторы, лимиты, дедлайны
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Эти модули должны грузиться только при использовании своей функции
+# (PDF ЕГРЮЛ, генерация документов, склонения, AI), а не при открытии страницы
+LAZY_MODULES = ["pdfplumber", "docxtpl", "docx", "num2words", "pymorphy3", "requests"]
+
+# Запускается во временной папке с data/employees.csv: замеряем экран со списком сотрудников
+STARTUP_SCRIPT = """
+import sys, time
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+t1 = time.perf_counter()
+at.run()
+t2 = time.perf_counter()
+print(f"HARNESS {t1 - t0:.4f}")
+print(f"RENDER {t2 - t1:.4f}")
+print(f"OPTIONS {len(at.multiselect[0].options) if at.multiselect else -1}")
+"""
+
+
+def parse_importtime(stderr):
+    """Разбирает вывод -X importtime: {модуль: (self_us, cumulative_us, уровень)}."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumul_us, name = line.split(":", 1)[1].split("|", 2)
+            self_us, cumul_us = int(self_us), int(cumul_us)
+        except ValueError:
+            continue
+        name = name[1:]  # пробел после разделителя
+        level = (len(name) - len(name.lstrip(" "))) // 2
+        modules[name.strip()] = (self_us, cumul_us, level)
+    return modules
+
+
+def summarize_by_package(modules):
+    totals = {}
+    for name, (self_us, _, _) in modules.items():
+        top = name.split(".")[0]
+        totals[top] = totals.get(top, 0) + self_us
+    return sorted(totals.items(), key=lambda kv: kv[1], reverse=True)
+
+
+def bench_startup(args):
+    import tempfile
+    print(f"⏳ Запускаю main.py (AppTest) с -X importtime, в базе {args.rows} сотрудников...")
+    # Своя рабочая папка: data/ пользователя не трогаем, а список сотрудников реально отрисовывается
+    with tempfile.TemporaryDirectory() as tmp:
+        os.makedirs(os.path.join(tmp, "data"))
+        write_csv(os.path.join(tmp, "data", "employees.csv"), args.rows)
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.getenv("PYTHONPATH")])))
+        t0 = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT, os.path.join(ROOT, "main.py")],
+            cwd=tmp, env=env, capture_output=True, text=True,
+        )
+        wall = time.perf_counter() - t0
+
+    if proc.returncode != 0:
+        print("❌ Приложение не запустилось:")
+        print("\n".join(l for l in proc.stderr.splitlines() if not l.startswith("import time:"))[-3000:])
+        return 1
+
+    timings = dict(line.split() for line in proc.stdout.splitlines() if line.startswith(("HARNESS", "RENDER", "OPTIONS")))
+    render = float(timings.get("RENDER", "nan"))
+    if int(timings.get("OPTIONS", "-1")) <= 0:
+        print("❌ Список сотрудников не отрисован - замер не отражает рабочий экран")
+        return 1
+    modules = parse_importtime(proc.stderr)
+    total_import = sum(v[0] for v in modules.values()) / 1e6
+
+    print(f"\n📦 Импортировано модулей: {len(modules)}, суммарно {total_import:.2f} c")
+    print("🔝 Самые тяжелые пакеты (self time):")
+    for pkg, us in summarize_by_package(modules)[:args.top]:
+        print(f"   {pkg:<30} {us / 1000:9.1f} мс")
+
+    loaded_lazy = [m for m in LAZY_MODULES if m in modules]
+    print(f"\n⏱️ Первая отрисовка main.py со списком сотрудников ({timings['OPTIONS']} в выборе): {render:.2f} c "
+          f"(процесс целиком: {wall:.2f} c, бюджет {args.budget:.2f} c)")
+
+    failed = False
+    if loaded_lazy:
+        print(f"❌ При открытии страницы загружены ленивые модули: {', '.join(loaded_lazy)}")
+        failed = True
+    else:
+        print("✅ Тяжелые модули при старте не загружаются")
+    if render > args.budget:
+        print("❌ Бюджет времени до первой отрисовки превышен")
+        failed = True
+    else:
+        print("✅ Бюджет времени до первой отрисовки соблюден")
+    return 1 if failed else 0
+
+
+IMPORT_SCRIPT = """
+import sys, time, resource
+mode, path = sys.argv[1], sys.argv[2]
+import pandas as pd
+t0 = time.perf_counter()
+if mode == "stream":
+    from employee_import import load_employee_table
+    table = load_employee_table(path)
+    rows = len(table)
+    t1 = time.perf_counter()
+    table.search("иванов 12")
+    t2 = time.perf_counter()
+    held = (table.df.memory_usage(deep=True).sum() + table.row_by_key.memory_usage(deep=True)
+            + table.keys_lower.memory_usage(deep=True))
+else:
+    # Прежний путь: pd.read_excel / pd.read_csv целиком + search_key + unique()
+    if path.endswith(".xlsx"): df = pd.read_excel(path)
+    else: df = pd.read_csv(path, sep=";", encoding="cp1251", on_bad_lines="skip")
+    df.columns = df.columns.str.strip()
+    df["search_key"] = df["ФИО"] + " — " + df["Должность"]
+    options = df["search_key"].unique()
+    rows = len(df)
+    t1 = t2 = time.perf_counter()
+    held = df.memory_usage(deep=True).sum() + sum(len(o) for o in options) * 2
+peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(f"RESULT {rows} {t1 - t0:.3f} {t2 - t1:.4f} {peak_kb} {held}")
+"""
+
+POSITIONS = ["Главный инженер проекта", "Главный архитектор проекта", "Производитель работ",
+             "Начальник отдела реставрации", "Бухгалтер", "Инженер ПТО", "Мастер участка"]
+EXTRA_COLUMNS = ["Табельный номер", "Подразделение", "Телефон", "Email", "Адрес регистрации", "Комментарий"]
+
+
+def make_employee_rows(n):
+    header = ["ФИО", "Должность", "Паспорт", "Кем выдан", "Дата выдачи"] + EXTRA_COLUMNS
+    yield header
+    for i in range(n):
+        yield [f"Иванов{i} Иван Иванович", POSITIONS[i % len(POSITIONS)], f"45{i:08d}",
+               "ОВД района Северный г. Москвы", "01.02.2015",
+               str(100000 + i), f"Отдел {i % 40}", f"+7 900 {i:07d}", f"user{i}@example.com",
+               f"г. Москва, ул. Строителей, д. {i % 300}, кв. {i % 120}", "-"]
+
+
+def write_csv(path, n):
+    import csv
+    with open(path, "w", encoding="cp1251", newline="") as f:
+        w = csv.writer(f, delimiter=";")
+        for row in make_employee_rows(n): w.writerow(row)
+
+
+def write_xlsx(path, n):
+    """Минимальный XLSX с общей таблицей строк, как у выгрузок из Excel/1С.
+
+    Workbook(write_only=True) пишет inline-строки, которые openpyxl читает в разы медленнее,
+    и замер не отражал бы реальные файлы. Собираем xlsx вручную потоково.
+    """
+    import zipfile
+    from xml.sax.saxutils import escape
+
+    def col_name(i):
+        name = ""
+        i += 1
+        while i:
+            i, r = divmod(i - 1, 26)
+            name = chr(65 + r) + name
+        return name
+
+    strings = {}
+    ns = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+    rel_ns = 'xmlns="http://schemas.openxmlformats.org/package/2006/relationships"'
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml",
+            '<?xml version="1.0" encoding="UTF-8"?><Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+            '</Types>')
+        zf.writestr("_rels/.rels",
+            f'<?xml version="1.0" encoding="UTF-8"?><Relationships {rel_ns}>'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>')
+        zf.writestr("xl/workbook.xml",
+            f'<?xml version="1.0" encoding="UTF-8"?><workbook {ns} '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            '<sheets><sheet name="Сотрудники" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        zf.writestr("xl/_rels/workbook.xml.rels",
+            f'<?xml version="1.0" encoding="UTF-8"?><Relationships {rel_ns}>'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+            '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/>'
+            '</Relationships>')
+        with zf.open("xl/worksheets/sheet1.xml", "w") as f:
+            f.write(f'<?xml version="1.0" encoding="UTF-8"?><worksheet {ns}>'
+                    f'<dimension ref="A1:{col_name(10)}{n + 1}"/><sheetData>'.encode())
+            for r, row in enumerate(make_employee_rows(n), start=1):
+                cells = []
+                for c, value in enumerate(row):
+                    idx = strings.setdefault(value, len(strings))
+                    cells.append(f'<c r="{col_name(c)}{r}" t="s"><v>{idx}</v></c>')
+                f.write(f'<row r="{r}">{"".join(cells)}</row>'.encode())
+            f.write(b"</sheetData></worksheet>")
+        with zf.open("xl/sharedStrings.xml", "w") as f:
+            f.write(f'<?xml version="1.0" encoding="UTF-8"?><sst {ns} count="{len(strings)}" uniqueCount="{len(strings)}">'.encode())
+            for value in strings:
+                f.write(f"<si><t>{escape(value)}</t></si>".encode())
+            f.write(b"</sst>")
+
+
+def bench_import(args):
+    import tempfile
+    try:
+        import resource  # noqa: F401 - замер пиковой памяти только на Unix
+    except ImportError:
+        print("❌ Замер памяти доступен только на Linux/macOS")
+        return 1
+    writers = {"csv": write_csv, "xlsx": write_xlsx}
+    modes = ["stream"] + (["legacy"] if args.legacy else [])
+    # ru_maxrss: Linux - КБ, macOS - байты
+    rss_div = 1024 * 1024 if sys.platform == "darwin" else 1024
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'формат':<6} {'строк':>9} {'загрузчик':<8} {'загрузка, c':>12} {'поиск, мс':>10} "
+              f"{'пик RSS, МБ':>12} {'данные, МБ':>11}")
+        for fmt in args.formats:
+            for n in args.rows:
+                path = os.path.join(tmp, f"employees_{n}.{fmt}")
+                t0 = time.perf_counter()
+                writers[fmt](path, n)
+                print(f"   (сгенерирован {os.path.basename(path)} за {time.perf_counter() - t0:.1f} c, "
+                      f"{os.path.getsize(path) / 1e6:.0f} МБ)")
+                for mode in modes:
+                    proc = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT, mode, path],
+                                          cwd=ROOT, capture_output=True, text=True)
+                    line = next((l for l in proc.stdout.splitlines() if l.startswith("RESULT")), None)
+                    if not line:
+                        print(f"❌ {fmt} {n} {mode}: {proc.stderr.strip()[-500:]}")
+                        continue
+                    _, rows, load_s, search_s, peak, held = line.split()
+                    search_ms = f"{float(search_s) * 1000:.1f}" if mode == "stream" else "-"
+                    print(f"{fmt:<6} {int(rows):>9} {mode:<8} {float(load_s):>12.2f} {search_ms:>10} "
+                          f"{int(peak) / rss_div:>12.0f} {int(held) / 2**20:>11.0f}")
+    return 0
+
+
+# --- ШЛЮЗ YANDEXGPT ---
+
+def _completion(text):
+    return {"result": {"alternatives": [{"message": {"role": "assistant", "text": text}}]}}
+
+
+def start_llm_stub():
+    """Локальная заглушка YandexGPT. Поведение задается путем: /ok, /429, /429-long, /503, /400, /stream, /drip."""
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    hits = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def reply(self, status, body, headers=None):
+            data = json.dumps(body, ensure_ascii=False).encode()
+            self.send_response(status)
+            for k, v in (headers or {}).items(): self.send_header(k, v)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            hits[self.path] = hits.get(self.path, 0) + 1
+            n = hits[self.path]
+            if self.headers.get("Authorization") != "Api-Key stub-key" or self.headers.get("x-folder-id") != "stub-folder":
+                return self.reply(401, {"error": "bad credentials"})
+            if self.path == "/ok":
+                return self.reply(200, _completion(f"ответ, запрос {len(payload['messages'][0]['text'])} символов"))
+            if self.path == "/429":
+                if n == 1: return self.reply(429, {"error": "quota"}, {"Retry-After": "0.3"})
+                return self.reply(200, _completion("после 429"))
+            if self.path == "/429-long":
+                return self.reply(429, {"error": "quota"}, {"Retry-After": "30"})
+            if self.path == "/503":
+                return self.reply(503, {"error": "unavailable"})
+            if self.path == "/400":
+                return self.reply(400, {"error": "bad request"})
+            # Поток: каждая строка - весь текст с начала, /drip - по строке раз в 0.3 с
+            self.send_response(200)
+            self.send_header("Connection", "close")
+            self.end_headers()
+            text = ""
+            try:
+                for word in ["Раз", " два", " три", " четыре", " пять"] * (20 if self.path == "/drip" else 1):
+                    text += word
+                    self.wfile.write((json.dumps(_completion(text), ensure_ascii=False) + "\n").encode())
+                    self.wfile.flush()
+                    if self.path == "/drip": time.sleep(0.3)
+            except OSError:
+                pass  # клиент закрыл соединение
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}", hits
+
+
+def check_gateway(args):
+    os.environ.update(YANDEX_API_KEY="stub-key", YANDEX_FOLDER_ID="stub-folder")
+    sys.path.insert(0, ROOT)
+    import ai_utils
+    from ai_utils import AIError, LLMClient, TokenBucket
+
+    ai_utils.BACKOFF_BASE = 0.01  # повторы без реальных пауз
+    server, base, hits = start_llm_stub()
+    results = []
+
+    def check(name, ok, detail=""):
+        results.append(ok)
+        print(f"{'✅' if ok else '❌'} {name}" + (f" ({detail})" if detail else ""))
+
+    def call(fn):
+        t0 = time.perf_counter()
+        try: return fn(), None, time.perf_counter() - t0
+        except AIError as e: return None, e, time.perf_counter() - t0
+
+    def client(path):
+        return LLMClient("stub-key", "stub-folder", url=base + path)
+
+    try:
+        os.environ["YANDEX_GPT_URL"] = base + "/ok"
+        llm = ai_utils.get_llm()
+        check("адрес берется из YANDEX_GPT_URL при создании клиента", llm.url == base + "/ok", llm.url)
+        check("клиенты переиспользуются", ai_utils.get_llm() is llm)
+        text, err, _ = call(lambda: ai_utils.generate_ai_duties("Прораб"))
+        check("обычный ответ", err is None and text.startswith("ответ"), text or err)
+
+        text, err, took = call(lambda: client("/429").complete("x"))
+        check("429 + Retry-After: ждем и повторяем", err is None and hits.get("/429") == 2 and took >= 0.3,
+              f"запросов {hits.get('/429')}, {took:.2f} c")
+
+        _, err, _ = call(lambda: client("/503").complete("x"))
+        check("5xx: повторы в пределах MAX_RETRIES, затем AIError",
+              err is not None and err.status == 503 and err.retryable and hits.get("/503") == ai_utils.MAX_RETRIES + 1,
+              f"запросов {hits.get('/503')}")
+
+        _, err, _ = call(lambda: client("/400").complete("x"))
+        check("4xx: без повторов", err is not None and err.status == 400 and not err.retryable and hits.get("/400") == 1,
+              f"запросов {hits.get('/400')}")
+
+        parts, err, _ = call(lambda: list(client("/stream").stream("x")))
+        check("поток отдает накопленный текст", err is None and parts[-1] == "Раз два три четыре пять", parts and parts[-1])
+
+        _, err, took = call(lambda: list(client("/drip").stream("x", timeout=1.0)))
+        check("дедлайн вызова обрывает медленный поток", err is not None and took < 1.5, f"{took:.2f} c")
+
+        _, err, took = call(lambda: client("/429-long").complete("x", timeout=2.0))
+        check("пауза до повтора за дедлайном: сразу AIError", err is not None and err.status == 429 and took < 1.0,
+              f"запросов {hits.get('/429-long')}, {took:.2f} c")
+
+        bucket = TokenBucket(rate=20, capacity=2)
+        t0 = time.perf_counter()
+        for _ in range(12): bucket.acquire()
+        took = time.perf_counter() - t0
+        check("token bucket: 12 запросов при 20/с и запасе 2 - около 0.5 c", 0.4 <= took <= 0.8, f"{took:.2f} c")
+        bucket = TokenBucket(rate=1, capacity=1)
+        bucket.acquire()
+        _, err, _ = call(lambda: bucket.acquire(timeout=0.1))
+        check("token bucket: ожидание дольше timeout - AIError", err is not None and err.retryable)
+    finally:
+        server.shutdown()
+    return 0 if all(results) else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры производительности Smart HR Architect")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_start = sub.add_parser("startup", help="профиль импорта и время до первой отрисовки")
+    p_start.add_argument("--budget", type=float, default=float(os.getenv("STARTUP_BUDGET_SEC", "3.0")),
+                         help="бюджет времени до первой отрисовки, секунд")
+    p_start.add_argument("--top", type=int, default=15, help="сколько пакетов показать")
+    p_start.add_argument("--rows", type=int, default=1000, help="сотрудников во временной базе")
+    p_start.set_defaults(func=bench_startup)
+
+    p_imp = sub.add_parser("import", help="загрузка базы сотрудников: время и пиковая память")
+    p_imp.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    p_imp.add_argument("--formats", nargs="+", choices=["csv", "xlsx"], default=["csv", "xlsx"])
+    p_imp.add_argument("--legacy", action="store_true", help="также замерить прежний pd.read_excel/read_csv")
+    p_imp.set_defaults(func=bench_import)
+
+    p_gw = sub.add_parser("gateway", help="шлюз YandexGPT против локальной заглушки")
+    p_gw.set_defaults(func=check_gateway)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
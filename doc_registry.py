@@ -0,0 +1,271 @@
+import os
+import re
+import sys
+import json
+import zlib
+import struct
+import hashlib
+import secrets
+import sqlite3
+import zipfile
+from datetime import datetime
+
+# Реестр сгенерированных документов.
+# - Номера документов резервируются атомарно (BEGIN IMMEDIATE), параллельные запуски не получат один номер.
+# - Каждый архив содержит 00_manifest.json: сотрудник, тип документа, номер, хеш шаблона, имя и смещение файла.
+# - Архивы складываются в data/archives, манифесты - в SQLite; "последний договор сотрудника" - один запрос
+#   по индексу, а сам файл читается из архива по смещению без распаковки остального.
+
+REGISTRY_PATH = "data/registry.sqlite3"
+ARCHIVE_DIR = "data/archives"
+MANIFEST_NAME = "00_manifest.json"
+MANIFEST_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    series TEXT PRIMARY KEY,
+    last INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    archive_path TEXT NOT NULL,
+    company TEXT,
+    style TEXT
+);
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    employee TEXT,
+    employee_key TEXT,
+    doc_type TEXT NOT NULL,
+    doc_number TEXT,
+    template TEXT,
+    template_sha256 TEXT,
+    member TEXT NOT NULL,
+    header_offset INTEGER NOT NULL,
+    compress_size INTEGER NOT NULL,
+    file_size INTEGER NOT NULL,
+    compress_type INTEGER NOT NULL,
+    crc INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_latest ON documents (employee_key, doc_type, id DESC);
+"""
+
+
+def connect(path=REGISTRY_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # isolation_level=None - транзакциями управляем сами (BEGIN IMMEDIATE)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def employee_key(name):
+    return " ".join(str(name or "").lower().replace("ё", "е").split())
+
+
+# --- НУМЕРАЦИЯ ---
+
+def _escape_braces(text):
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def number_series(base_num):
+    """"12-К" -> ("{}-К", 12), "007" -> ("{:03d}", 7), "АБ" -> ("АБ-{}", 1): шаблон серии и стартовый номер."""
+    m = re.search(r"\d+", base_num)
+    if not m:
+        return _escape_braces(base_num) + "-{}", 1
+    digits = m.group()
+    width = f":0{len(digits)}d" if digits.startswith("0") and len(digits) > 1 else ""
+    return _escape_braces(base_num[:m.start()]) + "{" + width + "}" + _escape_braces(base_num[m.end():]), int(digits)
+
+
+def _first_free(conn, series, start):
+    row = conn.execute("SELECT last FROM counters WHERE series = ?", (series,)).fetchone()
+    return start if row is None else max(start, row["last"] + 1)
+
+
+def _format_numbers(base_num, series, first, count):
+    numbers = [series.format(n) for n in range(first, first + count)]
+    # Серия без цифр ("АБ"): первый номер - само значение, дальше АБ-2, АБ-3 (как increment_doc_number)
+    if numbers and first == 1 and not re.search(r"\d", base_num):
+        numbers[0] = base_num
+    return numbers
+
+
+def preview_numbers(base_num, count, path=REGISTRY_PATH):
+    """Номера, которые выдаст reserve_numbers сейчас (без резервирования), и занят ли base_num.
+
+    Для подсказки в интерфейсе: (["14-К", "15-К"], True) - "12-К" уже выдан, нумерация сдвинута.
+    """
+    base_num = base_num.strip()
+    series, start = number_series(base_num)
+    first = start
+    if os.path.exists(path):
+        conn = connect(path)
+        try: first = _first_free(conn, series, start)
+        finally: conn.close()
+    return _format_numbers(base_num, series, first, max(count, 0)), first > start
+
+
+def reserve_numbers(base_num, count, path=REGISTRY_PATH):
+    """Резервирует count номеров подряд, начиная с base_num или со следующего свободного в серии."""
+    base_num = base_num.strip()
+    series, start = number_series(base_num)
+    if count <= 0: return []
+    conn = connect(path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        first = _first_free(conn, series, start)
+        last = first + count - 1
+        conn.execute("INSERT INTO counters (series, last) VALUES (?, ?) "
+                     "ON CONFLICT(series) DO UPDATE SET last = excluded.last", (series, last))
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction: conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return _format_numbers(base_num, series, first, count)
+
+
+# --- МАНИФЕСТ ---
+
+_template_hashes = {}
+
+def template_hash(path):
+    if not path or not os.path.exists(path): return None
+    key = (path, os.path.getmtime(path))
+    if key not in _template_hashes:
+        with open(path, "rb") as f:
+            _template_hashes[key] = hashlib.sha256(f.read()).hexdigest()
+    return _template_hashes[key]
+
+
+def doc_entry(member, doc_type, employee=None, doc_number=None, template=None):
+    return {
+        "member": member,
+        "doc_type": doc_type,
+        "employee": employee,
+        "doc_number": doc_number,
+        "template": template,
+        "template_sha256": template_hash(template),
+    }
+
+
+def new_run_id():
+    return f"{datetime.now():%Y%m%d-%H%M%S}-{secrets.token_hex(3)}"
+
+
+def build_manifest(zf, run_id, entries, company="", style=""):
+    """Манифест для открытого на запись архива: дописывает смещения уже записанных файлов."""
+    docs = []
+    for entry in entries:
+        info = zf.getinfo(entry["member"])
+        docs.append(dict(entry, header_offset=info.header_offset, compress_size=info.compress_size,
+                         file_size=info.file_size, compress_type=info.compress_type, crc=info.CRC))
+    return {
+        "version": MANIFEST_VERSION,
+        "run_id": run_id,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "company": company,
+        "style": style,
+        "documents": docs,
+    }
+
+
+def write_manifest(zf, manifest):
+    zf.writestr(MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=1))
+
+
+def save_run(manifest, zip_bytes, archive_dir=ARCHIVE_DIR, path=REGISTRY_PATH):
+    """Сохраняет архив в archive_dir и регистрирует его документы. Возвращает путь к архиву."""
+    os.makedirs(archive_dir, exist_ok=True)
+    archive_path = os.path.join(archive_dir, f"Docs_{manifest['run_id']}.zip")
+    tmp = archive_path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(zip_bytes)
+    os.replace(tmp, archive_path)
+
+    conn = connect(path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("INSERT INTO runs (run_id, created_at, archive_path, company, style) VALUES (?, ?, ?, ?, ?)",
+                     (manifest["run_id"], manifest["created_at"], archive_path,
+                      manifest.get("company"), manifest.get("style")))
+        conn.executemany(
+            "INSERT INTO documents (run_id, employee, employee_key, doc_type, doc_number, template, "
+            "template_sha256, member, header_offset, compress_size, file_size, compress_type, crc) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(manifest["run_id"], d["employee"], employee_key(d["employee"]) if d["employee"] else None,
+              d["doc_type"], d["doc_number"], d["template"], d["template_sha256"], d["member"],
+              d["header_offset"], d["compress_size"], d["file_size"], d["compress_type"], d["crc"])
+             for d in manifest["documents"]])
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction: conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return archive_path
+
+
+# --- ПОИСК И ЧТЕНИЕ ---
+
+def latest_document(employee, doc_type, path=REGISTRY_PATH):
+    """Последний документ типа doc_type для сотрудника (по индексу) или None."""
+    if not os.path.exists(path): return None
+    conn = connect(path)
+    try:
+        row = conn.execute(
+            "SELECT d.*, r.archive_path, r.created_at FROM documents d JOIN runs r USING (run_id) "
+            "WHERE d.employee_key = ? AND d.doc_type = ? ORDER BY d.id DESC LIMIT 1",
+            (employee_key(employee), doc_type)).fetchone()
+    finally:
+        conn.close()
+    return dict(row) if row else None
+
+
+_LOCAL_HEADER = struct.Struct("<4s5H3I2H")
+
+
+def read_member(archive_path, header_offset, compress_size, compress_type, crc=None):
+    """Читает один файл архива по смещению локального заголовка, не разбирая каталог ZIP."""
+    with open(archive_path, "rb") as f:
+        f.seek(header_offset)
+        header = f.read(_LOCAL_HEADER.size)
+        fields = _LOCAL_HEADER.unpack(header)
+        if fields[0] != b"PK\x03\x04":
+            raise ValueError(f"Нет заголовка файла по смещению {header_offset}")
+        name_len, extra_len = fields[-2], fields[-1]
+        f.seek(name_len + extra_len, os.SEEK_CUR)
+        raw = f.read(compress_size)
+    if compress_type == zipfile.ZIP_STORED: data = raw
+    elif compress_type == zipfile.ZIP_DEFLATED: data = zlib.decompress(raw, -15)
+    else: raise ValueError(f"Неподдерживаемое сжатие: {compress_type}")
+    if crc is not None and zlib.crc32(data) != crc:
+        raise ValueError("Контрольная сумма файла не совпадает")
+    return data
+
+
+def read_document(doc):
+    return read_member(doc["archive_path"], doc["header_offset"], doc["compress_size"],
+                       doc["compress_type"], doc["crc"])
+
+
+if __name__ == "__main__":
+    # python doc_registry.py "Иванов Иван Иванович" [Трудовой_договор] - выгрузить последний документ
+    if len(sys.argv) < 2:
+        print("Использование: python doc_registry.py \"ФИО\" [тип документа]")
+        sys.exit(1)
+    doc = latest_document(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else "Трудовой_договор")
+    if not doc:
+        print("❌ Документ не найден")
+        sys.exit(1)
+    out = os.path.basename(doc["member"])
+    with open(out, "wb") as f:
+        f.write(read_document(doc))
+    print(f"✅ № {doc['doc_number']} от {doc['created_at']} ({os.path.basename(doc['archive_path'])}) -> {out}")
@@ -0,0 +1,212 @@
+import os
+import re
+import sys
+import json
+import difflib
+import zipfile
+from xml.etree import ElementTree as ET
+
+# Индекс должностных обязанностей из готовых инструкций templates/instructions/<Должность>_styleN.docx.
+# Для должностей из индекса обязанности берутся из шаблона, YandexGPT вызывается только для остальных.
+# Собрать заранее: python duties_index.py (иначе соберется при первой генерации).
+
+INSTRUCTIONS_DIR = "templates/instructions"
+INDEX_PATH = "data/duties_index.json"
+INDEX_VERSION = 2
+# Похожесть каждого слова при нечетком сравнении (опечатка в одну букву в слове от 6 букв)
+FUZZY_CUTOFF = 0.8
+
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+# "III. Должностные обязанности", "2. ФУНКЦИОНАЛЬНЫЕ ОБЯЗАННОСТИ" - заголовок раздела
+DUTIES_HEADING = re.compile(r"^\s*(?:[IVX]+|\d+)\.?\s*(?:(?:должностные|функциональные)\s+)?обязанности", re.I)
+# Следующий раздел: "IV. Права", "3. ПРАВА" (но не пункт "3.1.")
+SECTION_HEADING = re.compile(r"^\s*(?:[IVX]+|\d+)\.\s*(?!\d)[^\W\d_]", re.I)
+ITEM_START = re.compile(r"^\s*\d+\.\d+\.?\s*")
+
+
+def read_docx_paragraphs(path):
+    """Текст абзацев docx без python-docx: разрывы строк внутри абзаца тоже дают перенос."""
+    with zipfile.ZipFile(path) as zf:
+        root = ET.fromstring(zf.read("word/document.xml"))
+    lines = []
+    for p in root.iter(W_NS + "p"):
+        buf = []
+        for el in p.iter():
+            if el.tag == W_NS + "t": buf.append(el.text or "")
+            elif el.tag in (W_NS + "br", W_NS + "cr"): buf.append("\n")
+            elif el.tag == W_NS + "tab": buf.append(" ")
+        lines.extend("".join(buf).split("\n"))
+    return lines
+
+
+def extract_duties(lines):
+    """Пункты раздела "Должностные обязанности" в виде маркированного списка."""
+    start = None
+    for i, line in enumerate(lines):
+        if DUTIES_HEADING.match(line):
+            start = i + 1
+            break
+    if start is None: return ""
+
+    items = []
+    for line in lines[start:]:
+        s = line.strip()
+        if not s: continue
+        if SECTION_HEADING.match(s) and not ITEM_START.match(s): break
+        if ITEM_START.match(s):
+            items.append(ITEM_START.sub("", s))
+        elif items:
+            items[-1] += " " + s
+        # строки до первого пункта ("... исполняет следующие обязанности:") пропускаем
+    return "\n".join(f"- {item}" for item in items if "{{" not in item)
+
+
+def normalize_position(text):
+    text = str(text or "").lower().replace("ё", "е")
+    return " ".join(re.findall(r"[а-яa-z0-9]+", text))
+
+
+def _agrees(adj, noun):
+    """Согласование прилагательного с существительным по падежу, числу и роду (в ед. числе)."""
+    a, n = adj.tag, noun.tag
+    if a.case != n.case or a.number != n.number: return False
+    return a.number != "sing" or not a.gender or not n.gender or a.gender == n.gender
+
+
+def _lemmas(words, morph):
+    # Первый разбор pymorphy3 для косвенных падежей часто не тот: "главного" -> "главное" (сущ.).
+    # Прилагательное берем в разборе, согласованном с ближайшим существительным справа
+    parses = [morph.parse(w) for w in words]
+    lemmas = []
+    for i, variants in enumerate(parses):
+        lemma = variants[0].normal_form
+        head = None
+        for following in parses[i + 1:]:
+            if any(p.tag.POS == "NOUN" for p in following):
+                head = [p for p in following if p.tag.POS == "NOUN"]
+                break
+            if not any(p.tag.POS in ("ADJF", "PRTF") for p in following): break
+        if head:
+            for p in variants:
+                if p.tag.POS in ("ADJF", "PRTF") and any(_agrees(p, h) for h in head):
+                    lemma = p.normal_form
+                    break
+        lemmas.append(lemma.replace("ё", "е"))
+    return lemmas
+
+
+def position_key(text, morph=None):
+    """Нормальная форма должности: "Главного инженера проекта" -> "главный инженер проект"."""
+    words = normalize_position(text).split()
+    if morph is not None:
+        words = _lemmas(words, morph)
+    return " ".join(words)
+
+
+def _templates_mtime(directory):
+    files = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".docx")]
+    return max((os.path.getmtime(f) for f in files), default=0)
+
+
+def build_index(directory=INSTRUCTIONS_DIR, morph=None):
+    positions = {}
+    for fname in sorted(os.listdir(directory)):
+        m = re.match(r"^(?!~\$)(.+)_style\d+\.docx$", fname)
+        if not m: continue
+        position = m.group(1).strip()
+        if position in positions: continue
+        try:
+            duties = extract_duties(read_docx_paragraphs(os.path.join(directory, fname)))
+        except (zipfile.BadZipFile, KeyError, ET.ParseError):
+            continue
+        if duties:
+            positions[position] = {"key": position_key(position, morph), "source": fname, "duties": duties}
+    return {
+        "version": INDEX_VERSION,
+        "lemmatized": morph is not None,
+        "templates_mtime": _templates_mtime(directory),
+        "positions": positions,
+    }
+
+
+def save_index(index, path=INDEX_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def load_index(path=INDEX_PATH, directory=INSTRUCTIONS_DIR, morph=None):
+    """Читает индекс с диска; если шаблоны новее или индекса нет - пересобирает и сохраняет."""
+    index = None
+    if os.path.exists(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = None
+    if (not index or index.get("version") != INDEX_VERSION
+            or index.get("lemmatized") != (morph is not None)
+            or (os.path.isdir(directory) and index.get("templates_mtime", 0) < _templates_mtime(directory))):
+        if not os.path.isdir(directory): return DutiesIndex({}, morph)
+        index = build_index(directory, morph)
+        try: save_index(index, path)
+        except OSError: pass
+    return DutiesIndex(index.get("positions", {}), morph)
+
+
+class DutiesIndex:
+    def __init__(self, positions, morph=None):
+        self.morph = morph
+        self.by_key = {}
+        self.by_tokens = {}
+        for position, entry in positions.items():
+            found = {"position": position, "duties": entry["duties"]}
+            self.by_key[entry["key"]] = found
+            self.by_tokens[" ".join(sorted(entry["key"].split()))] = found
+
+    def __len__(self):
+        return len(self.by_key)
+
+    def _fuzzy(self, key):
+        # Опечатки и словоформы, но не лишние/недостающие слова: "Начальник отдела" не равно
+        # "Начальник отдела ДПИ". Число слов совпадает, каждое слово похоже на свое
+        words = key.split()
+        best, best_score = None, 0
+        for candidate in self.by_key:
+            other = candidate.split()
+            if len(other) != len(words): continue
+            scores = [1.0 if a == b else difflib.SequenceMatcher(None, a, b).ratio() for a, b in zip(words, other)]
+            if min(scores) < FUZZY_CUTOFF: continue
+            if sum(scores) > best_score:
+                best, best_score = candidate, sum(scores)
+        return best
+
+    def lookup(self, position):
+        """Обязанности для должности: {"position", "duties", "fuzzy"} или None, если в шаблонах такой нет.
+
+        fuzzy=True - должность найдена с поправкой на опечатку, position - имя шаблона.
+        """
+        key = position_key(position, self.morph)
+        if not key: return None
+        if key in self.by_key: return dict(self.by_key[key], fuzzy=False)
+        tokens = " ".join(sorted(key.split()))
+        if tokens in self.by_tokens: return dict(self.by_tokens[tokens], fuzzy=False)
+        close = self._fuzzy(key)
+        return dict(self.by_key[close], fuzzy=True) if close else None
+
+
+if __name__ == "__main__":
+    try:
+        import pymorphy3
+        morph = pymorphy3.MorphAnalyzer()
+    except ImportError:
+        morph = None
+        print("⚠️ pymorphy3 не установлен - индекс без лемматизации")
+    index = build_index(sys.argv[1] if len(sys.argv) > 1 else INSTRUCTIONS_DIR, morph)
+    save_index(index)
+    for position, entry in index["positions"].items():
+        print(f"✅ {position}: {entry['duties'].count(chr(10)) + 1} пунктов ({entry['source']})")
+    print(f"💾 Сохранено в {INDEX_PATH}")
@@ -0,0 +1,142 @@
+import pandas as pd
+
+# Потоковая загрузка баз сотрудников/ответственных.
+# XLSX читается openpyxl в режиме read_only построчно, CSV - кусками по CHUNK_ROWS строк.
+# Сохраняются только колонки, которые нужны генератору, индекс поиска строится по ходу чтения.
+
+CHUNK_ROWS = 50_000
+SEARCH_LIMIT = 50
+# Строки в Arrow-буферах: без накладных расходов на python-объект на каждую ячейку
+TEXT_DTYPE = "string[pyarrow]"
+
+NAME_COL = "ФИО"
+POS_COL = "Должность"
+# Паспорт (build_passport_string) и основание полномочий ответственного
+KEEP_KEYWORDS = ["паспорт", "серия", "номер", "документ", "выдан", "кем", "дата", "когда", "число",
+                 "основание", "доверенность"]
+
+CSV_VARIANTS = [("cp1251", ";"), ("utf-8-sig", ","), ("cp1251", ",")]
+
+
+def keep_column(name):
+    name = str(name).strip()
+    if name in (NAME_COL, POS_COL): return True
+    low = name.lower()
+    return any(k in low for k in KEEP_KEYWORDS)
+
+
+def _is_xlsx(source):
+    name = source if isinstance(source, str) else getattr(source, "name", "")
+    return str(name).lower().endswith(".xlsx")
+
+
+def _xlsx_frame(rows, columns):
+    # Текстовые колонки - в Arrow, чтобы не держать строки из общей таблицы openpyxl;
+    # числа и даты остаются как есть (так их раньше отдавал pd.read_excel)
+    df = pd.DataFrame(rows, columns=columns)
+    for col in df.columns:
+        if pd.api.types.infer_dtype(df[col], skipna=True) in ("string", "empty"):
+            df[col] = df[col].astype(TEXT_DTYPE)
+    return df
+
+
+def iter_xlsx_chunks(source, chunk_rows=CHUNK_ROWS):
+    from openpyxl import load_workbook
+
+    if hasattr(source, "seek"): source.seek(0)
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        # Не доверяем <dimension> из файла: без него openpyxl сначала сканирует весь лист,
+        # а с неверным обрезает строки. Читаем до конца как есть
+        ws.reset_dimensions()
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, None)
+        if not header: return
+        idx = [i for i, h in enumerate(header) if h is not None and keep_column(h)]
+        columns = [str(header[i]).strip() for i in idx]
+        buf = []
+        for row in rows:
+            if row is None or all(v is None for v in row): continue
+            buf.append([row[i] if i < len(row) else None for i in idx])
+            if len(buf) >= chunk_rows:
+                yield _xlsx_frame(buf, columns)
+                buf = []
+        if buf:
+            yield _xlsx_frame(buf, columns)
+    finally:
+        wb.close()
+
+
+def iter_csv_chunks(source, encoding, sep, chunk_rows=CHUNK_ROWS):
+    if hasattr(source, "seek"): source.seek(0)
+    reader = pd.read_csv(source, sep=sep, encoding=encoding, on_bad_lines="skip", dtype=TEXT_DTYPE,
+                         usecols=keep_column, chunksize=chunk_rows)
+    with reader:
+        for chunk in reader:
+            chunk.columns = chunk.columns.str.strip()
+            yield chunk
+
+
+class EmployeeTable:
+    """Таблица сотрудников + индекс поиска по ключу "ФИО — Должность"."""
+
+    def __init__(self, chunks):
+        frames, keys = [], []
+        for chunk in chunks:
+            if NAME_COL not in chunk.columns: continue
+            chunk = chunk[chunk[NAME_COL].notna()].reset_index(drop=True)
+            chunk[NAME_COL] = chunk[NAME_COL].astype(str).astype(TEXT_DTYPE).str.strip()
+            if POS_COL in chunk.columns:
+                pos = chunk[POS_COL].fillna("").astype(str).astype(TEXT_DTYPE).str.strip()
+                chunk[POS_COL] = pos.astype("category")
+                keys.append(chunk[NAME_COL] + " — " + pos)
+            else:
+                keys.append(chunk[NAME_COL])
+            frames.append(chunk)
+        if not frames:
+            raise ValueError(f"Нет колонки '{NAME_COL}'")
+
+        positions = [f[POS_COL] for f in frames if POS_COL in f.columns]
+        self.df = pd.concat(frames, ignore_index=True)
+        if len(positions) == len(frames):
+            self.df[POS_COL] = pd.api.types.union_categoricals(positions, ignore_order=True)
+        keys = pd.concat(keys, ignore_index=True)
+        # Ключ -> номер первой строки с ним (как раньше .iloc[0] при поиске по search_key)
+        first = ~keys.duplicated()
+        unique = keys[first]
+        self.row_by_key = pd.Series(unique.index, index=pd.Index(unique))
+        self.keys_lower = unique.str.lower().reset_index(drop=True)
+
+    def __len__(self):
+        return len(self.df)
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Первые limit уникальных ключей, содержащих query (без учета регистра)."""
+        query = (query or "").strip().lower()
+        if not query:
+            return list(self.row_by_key.index[:limit])
+        mask = self.keys_lower.str.contains(query, regex=False).fillna(False).to_numpy(dtype=bool)
+        return list(self.row_by_key.index[mask][:limit])
+
+    def __contains__(self, key):
+        return key in self.row_by_key.index
+
+    def get(self, key):
+        """Строка по ключу или None, если ключа нет (например, файл базы заменили)."""
+        if key not in self: return None
+        return self.df.iloc[int(self.row_by_key[key])]
+
+
+def load_employee_table(source, chunk_rows=CHUNK_ROWS):
+    if _is_xlsx(source):
+        return EmployeeTable(iter_xlsx_chunks(source, chunk_rows))
+
+    last_error = None
+    for encoding, sep in CSV_VARIANTS:
+        try:
+            chunks = iter_csv_chunks(source, encoding, sep, chunk_rows)
+            return EmployeeTable(chunks)
+        except (UnicodeDecodeError, ValueError, pd.errors.ParserError) as e:
+            last_error = e
+    raise ValueError(f"Не удалось прочитать CSV: {last_error}")
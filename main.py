@@ -4,13 +4,7 @@ import os
 import io
 import zipfile
 import re
-import pdfplumber
-from docxtpl import DocxTemplate, RichText, InlineImage
-from docx.shared import Mm
-from num2words import num2words
 from datetime import date
-import pymorphy3
-from PIL import Image, ImageOps
 
 # --- 1. НАСТРОЙКИ ---
 st.set_page_config(page_title="Smart HR Architect", layout="wide", page_icon="🏗️")
@@ -24,22 +18,44 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- 2. ПОДКЛЮЧЕНИЕ МОДУЛЕЙ ---
-try:
-    morph = pymorphy3.MorphAnalyzer()
-except:
-    pass
+# Тяжелые библиотеки (pdfplumber, docxtpl, num2words, pymorphy3, PIL) импортируются
+# внутри функций при первом использовании, чтобы список сотрудников открывался быстро.
+# Замер времени запуска: python benchmark.py startup
+
+@st.cache_resource(show_spinner=False)
+def get_morph():
+    try:
+        import pymorphy3
+        return pymorphy3.MorphAnalyzer()
+    except Exception:
+        return None
+
+@st.cache_resource(show_spinner=False)
+def get_duties_index():
+    # Обязанности из готовых инструкций: для этих должностей YandexGPT не вызывается
+    from duties_index import load_index
+    return load_index(morph=get_morph())
 
 try:
-    from ai_utils import generate_ai_duties, extract_data_from_egrul
+    from ai_utils import generate_ai_duties, extract_data_from_egrul, AIError
 except ImportError:
+    class AIError(Exception): pass
     def generate_ai_duties(p): return ""
-    def extract_data_from_egrul(t): return None
+    def extract_data_from_egrul(t, on_field=None): return None
 
 # --- 3. STATE ---
 keys = ["c_name", "c_short_name", "c_inn", "c_kpp", "c_ogrn", "c_address", "c_boss", "c_boss_pos", "c_opf"]
 for k in keys:
     if k not in st.session_state:
         st.session_state[k] = ""
+if "egrul_warnings" not in st.session_state:
+    st.session_state.egrul_warnings = []
+
+EGRUL_LABELS = {
+    "opf": "ОПФ", "name": "Название", "short_name": "Сокращенное название",
+    "inn": "ИНН", "kpp": "КПП", "ogrn": "ОГРН", "address": "Адрес",
+    "boss_name": "ФИО Директора", "boss_pos": "Должность",
+}
 
 # --- 4. ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ---
 
@@ -95,13 +111,11 @@ def clean_case(text):
         return text.capitalize() # БЫЛО: text.capitalize(). ТЕПЕРЬ: можно сделать умнее, но пока оставим
     return text
 
-def try_read_csv(file_source, encoding, sep):
-    try:
-        if hasattr(file_source, 'seek'): file_source.seek(0)
-        df = pd.read_csv(file_source, sep=sep, encoding=encoding, on_bad_lines='skip')
-        if len(df.columns) > 1: return df
-    except: pass
-    return None
+@st.cache_resource(show_spinner="Загружаю базу...", max_entries=4)
+def load_table(source_id, _file_source):
+    # Кешируем по файлу (id загрузки или путь + mtime), а не пересчитываем на каждом rerun
+    from employee_import import load_employee_table
+    return load_employee_table(_file_source)
 
 def load_data_file(key_label, local_filename):
     file_source = None
@@ -115,33 +129,21 @@ def load_data_file(key_label, local_filename):
             
     if not file_source: return None
 
+    if uploaded:
+        source_id = ("upload", getattr(uploaded, "file_id", None) or uploaded.name, uploaded.size)
+    else:
+        source_id = ("local", file_source, os.path.getmtime(file_source))
+
     try:
-        df = None
-        if hasattr(file_source, 'name') and file_source.name.endswith('.xlsx'):
-             df = pd.read_excel(file_source)
-        elif isinstance(file_source, str) and file_source.endswith('.xlsx'):
-             df = pd.read_excel(file_source)
-        else:
-            df = try_read_csv(file_source, 'cp1251', ';')
-            if df is None: df = try_read_csv(file_source, 'utf-8-sig', ',')
-            if df is None: df = try_read_csv(file_source, 'cp1251', ',')
-
-        if df is not None:
-            df.columns = df.columns.str.strip()
-            if 'ФИО' in df.columns:
-                if 'Должность' in df.columns:
-                    df['search_key'] = df['ФИО'] + " — " + df['Должность']
-                else:
-                    df['search_key'] = df['ФИО']
-            return df
-        return None
+        return load_table(source_id, file_source)
     except Exception as e:
         st.sidebar.error(f"Ошибка {key_label}: {e}")
         return None
 
-def parse_egrul_pdf_ai(pdf_file):
+def parse_egrul_pdf_ai(pdf_file, on_field=None):
     full_text = ""
     try:
+        import pdfplumber
         with pdfplumber.open(pdf_file) as pdf:
             for page in pdf.pages:
                 extracted = page.extract_text()
@@ -149,12 +151,16 @@ def parse_egrul_pdf_ai(pdf_file):
     except Exception as e:
         return None, f"Ошибка PDF: {e}"
     if not full_text: return None, "PDF пустой."
-    data = extract_data_from_egrul(full_text)
+    try:
+        data = extract_data_from_egrul(full_text, on_field=on_field)
+    except AIError as e:
+        return None, f"Ошибка AI: {e}"
     if not data: return None, "AI не вернул данные."
     return data, None
 
 def make_times_new_roman(text):
     if not text: return ""
+    from docxtpl import RichText
     rt = RichText()
     rt.add(str(text), font='Times New Roman', size=24)
     return rt
@@ -162,7 +168,8 @@ def make_times_new_roman(text):
 # --- ФУНКЦИИ ОБРАБОТКИ ТЕКСТА ---
 
 def get_inflected(text: str, case_tag: str) -> str:
-    if not text or 'morph' not in globals(): return text
+    morph = get_morph()
+    if not text or morph is None: return text
     res = []
     for w in text.split():
         try:
@@ -200,7 +207,8 @@ def get_gender_word(fio: str, word_masc: str, word_fem: str) -> str:
             return word_fem
         if patr.endswith("вич"):
             return word_masc
-    if len(parts) >= 2 and 'morph' in globals():
+    morph = get_morph()
+    if len(parts) >= 2 and morph is not None:
         try:
             parsed = morph.parse(parts[1])[0] 
             if 'femn' in parsed.tag: return word_fem
@@ -230,6 +238,7 @@ def trim_whitespace(img):
 
 def create_overlay_image(sign_path, stamp_path):
     try:
+        from PIL import Image
         if not sign_path or not os.path.exists(sign_path): return None
         sign_img = Image.open(sign_path).convert("RGBA")
         sign_img = trim_whitespace(sign_img)
@@ -278,6 +287,7 @@ def get_image_object(doc, filename_or_path, width_mm, do_trim=True):
     final_path = path
     if do_trim and "temp" not in path: 
         try:
+            from PIL import Image
             img = Image.open(path)
             img = trim_whitespace(img)
             trimmed_name = f"trimmed_{os.path.basename(path)}"
@@ -287,6 +297,8 @@ def get_image_object(doc, filename_or_path, width_mm, do_trim=True):
             return f"[ОШИБКА ОБРАБОТКИ: {e}]"
 
     try: 
+        from docxtpl import InlineImage
+        from docx.shared import Mm
         return InlineImage(doc, final_path, width=Mm(width_mm))
     except Exception as e:
         return f"[ОШИБКА ВСТАВКИ: {e}]"
@@ -294,8 +306,8 @@ def get_image_object(doc, filename_or_path, width_mm, do_trim=True):
 # --- 5. ИНТЕРФЕЙС ---
 
 st.sidebar.header("📂 Базы данных")
-df_emp = load_data_file("Сотрудников", "employees")
-df_resp = load_data_file("Ответственных", "responsible")
+emp_table = load_data_file("Сотрудников", "employees")
+resp_table = load_data_file("Ответственных", "responsible")
 
 st.sidebar.divider()
 st.sidebar.header("⚙️ Настройки")
@@ -311,10 +323,25 @@ with st.sidebar.expander("✒️ Загрузить подписи сотруд
                 dest.write(f.getbuffer())
         st.success(f"Загружено {len(uploaded_sigs)} подписей")
 
+with st.sidebar.expander("🗂️ Найти в архиве"):
+    arch_fio = st.text_input("ФИО сотрудника", key="arch_fio")
+    arch_type = st.selectbox("Документ", ["Трудовой_договор", "Приказ", "Должностная"], key="arch_type")
+    if arch_fio:
+        from doc_registry import latest_document, read_document
+        try:
+            found_doc = latest_document(arch_fio, arch_type)
+            if found_doc:
+                st.caption(f"№ {found_doc['doc_number']} от {found_doc['created_at'][:10]}, {os.path.basename(found_doc['archive_path'])}")
+                st.download_button("💾 Скачать", read_document(found_doc), found_doc["member"], key="arch_dl")
+            else:
+                st.caption("Не найдено")
+        except Exception as e:
+            st.error(f"Ошибка архива: {e}")
+
 st.title("🏗️ Генератор PRO (v8.0)")
 st.markdown("---")
 
-if df_emp is None:
+if emp_table is None:
     st.info("👈 Загрузите базу Сотрудников.")
     st.stop()
 
@@ -322,22 +349,49 @@ col_left, col_right = st.columns([1, 1.3])
 
 with col_left:
     st.subheader("1. Выбор персонала")
-    options = df_emp['search_key'].unique()
-    selected_emp_keys = st.multiselect("Сотрудники:", options)
+    # Поиск по базе на сервере: в браузер уходят только найденные варианты и уже выбранные
+    if "selected_emp_keys" not in st.session_state:
+        st.session_state.selected_emp_keys = []
+    # После замены файла базы выбранных ранее сотрудников в ней может не быть
+    st.session_state.selected_emp_keys = [k for k in st.session_state.selected_emp_keys if k in emp_table]
+    emp_query = st.text_input(f"Поиск по ФИО или должности (в базе {len(emp_table)}):", key="emp_query")
+    found_keys = emp_table.search(emp_query)
+    options = list(dict.fromkeys(st.session_state.selected_emp_keys + found_keys))
+    selected_emp_keys = st.multiselect("Сотрудники:", options, key="selected_emp_keys")
+    if emp_query and not found_keys:
+        st.caption("Никого не найдено")
     
     st.markdown("")
     st.write("🧑‍💼 **Ответственное лицо:**")
     selected_resp_key = "--- Не указывать ---"
     
-    if df_resp is not None:
-        resp_options = ["--- Не указывать ---"] + list(df_resp['search_key'].unique())
-        selected_resp_key = st.selectbox("Кто упоминается в документах:", resp_options)
+    if resp_table is not None:
+        # Так же, как сотрудники: варианты ищем на сервере, выбранный сохраняем, пока он есть в базе
+        if st.session_state.get("selected_resp_key") not in resp_table:
+            st.session_state.selected_resp_key = "--- Не указывать ---"
+        resp_query = st.text_input(f"Поиск ответственного (в базе {len(resp_table)}):", key="resp_query")
+        found_resp = resp_table.search(resp_query)
+        resp_options = list(dict.fromkeys(["--- Не указывать ---", st.session_state.selected_resp_key] + found_resp))
+        selected_resp_key = st.selectbox("Кто упоминается в документах:", resp_options, key="selected_resp_key")
+        if resp_query and not found_resp:
+            st.caption("Никого не найдено")
 
     st.markdown("---")
     st.subheader("2. Параметры")
     c1, c2 = st.columns(2)
     with c1:
-        start_doc_num = st.text_input("Номер документа", "12-К")
+        start_doc_num = st.text_input("Начальный номер документа", "12-К",
+                                      help="Номера идут подряд, но не меньше следующего свободного в реестре")
+        if start_doc_num.strip():
+            from doc_registry import preview_numbers
+            try:
+                planned, taken = preview_numbers(start_doc_num, max(len(selected_emp_keys), 1))
+                if taken:
+                    st.caption(f"⚠️ {start_doc_num.strip()} уже занят, следующий свободный: {planned[0]}")
+                if len(planned) > 1:
+                    st.caption(f"Будут выданы № {planned[0]} - {planned[-1]}")
+            except Exception:
+                pass  # реестр недоступен - номера посчитаются от введенного
         salary = st.number_input("Оклад", value=120000, step=5000)
     with c2:
         doc_date = st.date_input("Дата", date.today())
@@ -349,8 +403,20 @@ with col_right:
     
     if uploaded_pdf:
         if st.button("🚀 Распознать через YandexGPT", type="secondary"):
+            # Поля показываются по мере того, как их присылает YandexGPT
+            live_box = st.empty()
+            live_rows = []
+            field_warnings = []
+
+            def show_field(key, value, error):
+                mark = "⚠️" if error else "✅"
+                live_rows.append(f"{mark} **{EGRUL_LABELS.get(key, key)}:** {value}" + (f" — _{error}_" if error else ""))
+                if error: field_warnings.append(f"{EGRUL_LABELS.get(key, key)}: {error}")
+                live_box.markdown("  \n".join(live_rows))
+
             with st.spinner("Анализирую..."):
-                extracted, err = parse_egrul_pdf_ai(uploaded_pdf)
+                extracted, err = parse_egrul_pdf_ai(uploaded_pdf, on_field=show_field)
+                st.session_state.egrul_warnings = field_warnings
                 if err: st.error(err)
                 elif extracted:
                     if "inn" in extracted: st.session_state.c_inn = extracted["inn"]
@@ -393,6 +459,8 @@ with col_right:
             with open(director_path_temp, "wb") as f: f.write(up_dir.getbuffer())
 
     st.markdown("##### 📝 Реквизиты:")
+    for w in st.session_state.egrul_warnings:
+        st.warning(f"Проверьте: {w}")
     st.text_input("Орг.-правовая форма", key="c_opf")
     st.text_input("Название (без ОПФ)", key="c_name")
     st.text_input("Сокращенное название", key="c_short_name")
@@ -412,11 +480,19 @@ if st.button("🚀 Сформировать документы", type="primary",
         st.error("❌ Выберите сотрудников!")
         st.stop()
 
+    from docxtpl import DocxTemplate
+    from num2words import num2words
+    import doc_registry
+
     # --- ПОДГОТОВКА ОБЩИХ ДАННЫХ ---
     tasks = []
     for key in selected_emp_keys:
-        row = df_emp[df_emp['search_key'] == key].iloc[0]
-        tasks.append({"data": row, "role": "emp"})
+        row = emp_table.get(key)
+        if row is not None:
+            tasks.append({"data": row, "role": "emp"})
+    if not tasks:
+        st.error("❌ Выбранных сотрудников нет в загруженной базе, выберите заново")
+        st.stop()
         
     opf = st.session_state.c_opf.strip()
     name = st.session_state.c_name.strip()
@@ -434,8 +510,12 @@ if st.button("🚀 Сформировать документы", type="primary",
     resp_name_str = ""
     resp_pos_str = ""
     resp_doc_str = ""
-    if df_resp is not None and selected_resp_key != "--- Не указывать ---":
-        r_row = df_resp[df_resp['search_key'] == selected_resp_key].iloc[0]
+    r_row = None
+    if resp_table is not None and selected_resp_key != "--- Не указывать ---":
+        r_row = resp_table.get(selected_resp_key)
+        if r_row is None:
+            st.warning("⚠️ Ответственного нет в загруженной базе, в документах будет указан руководитель")
+    if r_row is not None:
         resp_name_str = r_row.get('ФИО', '')
         resp_pos_str = r_row.get('Должность', '')
         for k_resp, v_resp in r_row.items():
@@ -454,8 +534,20 @@ if st.button("🚀 Сформировать документы", type="primary",
     if director_path_temp:
         combo_path = create_overlay_image(director_path_temp, stamp_path_temp)
     
+    # Номера резервируются в реестре: параллельные запуски не выдадут один и тот же номер
+    try:
+        doc_numbers = doc_registry.reserve_numbers(start_doc_num, len(tasks))
+    except Exception as e:
+        st.warning(f"⚠️ Реестр номеров недоступен ({e}), номера считаются от введенного")
+        doc_numbers = [increment_doc_number(start_doc_num, i) for i in range(len(tasks))]
+    run_id = doc_registry.new_run_id()
+    manifest_docs = []
+
     zip_buf = io.BytesIO()
     files_ok = 0
+    ai_failures = []
+    fuzzy_duties = []
+    duties_by_pos = {}
     progress = st.progress(0)
     
     # 2. ДОБАВЛЯЕМ СТИЛЬ В ИМЕНА ФАЙЛОВ
@@ -467,6 +559,8 @@ if st.button("🚀 Сформировать документы", type="primary",
 Компания: {full_company_name}
 Использован стиль: {selected_style}
 Сотрудников обработано: {len(tasks)}
+Номера документов: {doc_numbers[0]} - {doc_numbers[-1]}
+Запуск: {run_id}
         """
         zf.writestr("00_INFO.txt", info_text)
 
@@ -494,6 +588,7 @@ if st.button("🚀 Сформировать документы", type="primary",
                 tmp_inv = io.BytesIO()
                 doc_inv.save(tmp_inv)
                 zf.writestr(f"00_Опись{style_suffix}.docx", tmp_inv.getvalue())
+                manifest_docs.append(doc_registry.doc_entry(f"00_Опись{style_suffix}.docx", "Опись", template=inventory_path))
                 files_ok += 1
             except Exception as e: pass
 
@@ -533,14 +628,15 @@ if st.button("🚀 Сформировать документы", type="primary",
                 tmp_ord = io.BytesIO()
                 doc_ord.save(tmp_ord)
                 zf.writestr(f"00_Сводный_приказ_Ответственные{style_suffix}.docx", tmp_ord.getvalue())
+                manifest_docs.append(doc_registry.doc_entry(f"00_Сводный_приказ_Ответственные{style_suffix}.docx",
+                                                            "Сводный_приказ", template=order_tmpl_path))
                 files_ok += 1
             except Exception as e:
                 st.error(f"Ошибка сводного приказа: {e}")
 
         # --- 3. ПРИКАЗ НА ОТВЕТСТВЕННОГО ---
         target_resp = {}
-        if df_resp is not None and selected_resp_key != "--- Не указывать ---":
-             r_row = df_resp[df_resp['search_key'] == selected_resp_key].iloc[0]
+        if r_row is not None:
              target_resp = { "name": r_row['ФИО'], "pos": r_row.get('Должность', ''), "is_director": False }
              filename_resp = f"Приказ_Ответственный_{get_initials(r_row['ФИО'])}"
         else:
@@ -571,6 +667,8 @@ if st.button("🚀 Сформировать документы", type="primary",
                 tmp_r = io.BytesIO()
                 doc_r.save(tmp_r)
                 zf.writestr(f"00_{filename_resp}{style_suffix}.docx", tmp_r.getvalue())
+                manifest_docs.append(doc_registry.doc_entry(f"00_{filename_resp}{style_suffix}.docx", "Приказ_Ответственный",
+                                                            employee=target_resp["name"], template=order_tmpl_path))
                 files_ok += 1
              except Exception as e: pass
 
@@ -580,11 +678,22 @@ if st.button("🚀 Сформировать документы", type="primary",
             role = task["role"]
             progress.progress((i + 1) / len(tasks))
             
-            doc_num = increment_doc_number(start_doc_num, i)
+            doc_num = doc_numbers[i]
             ai_duties = ""
-            if use_ai_duties and role == "emp":
-                try: ai_duties = generate_ai_duties(emp['Должность'])
-                except: ai_duties = "Ошибка генерации"
+            if use_ai_duties and role == "emp" and clean_val(emp.get('Должность')):
+                pos = emp['Должность']
+                if pos not in duties_by_pos:
+                    found = get_duties_index().lookup(pos)
+                    if found:
+                        duties_by_pos[pos] = found["duties"]
+                        if found["fuzzy"]: fuzzy_duties.append(f"{pos} → {found['position']}")
+                    else:
+                        # При сбое AI обязанности остаются пустыми - текст ошибки в договор не пишем
+                        try: duties_by_pos[pos] = generate_ai_duties(pos)
+                        except AIError as e:
+                            duties_by_pos[pos] = ""
+                            ai_failures.append(f"{pos}: {e}")
+                ai_duties = duties_by_pos[pos]
 
             full_passport_str = build_passport_string(emp)
             pos_nom = emp.get('Должность', '')
@@ -627,14 +736,29 @@ if st.button("🚀 Сформировать документы", type="primary",
                         doc.save(tmp)
                         safe_fio = get_initials(emp['ФИО']).replace(".", "")
                         suffix = "_RESP" if role == "resp" else ""
-                        zf.writestr(f"{i+1:02d}_{safe_fio}{suffix}_{name}{style_suffix}.docx", tmp.getvalue())
+                        member = f"{i+1:02d}_{safe_fio}{suffix}_{name}{style_suffix}.docx"
+                        zf.writestr(member, tmp.getvalue())
+                        manifest_docs.append(doc_registry.doc_entry(member, name, employee=emp['ФИО'],
+                                                                    doc_number=doc_num, template=path))
                         files_ok += 1
                     except Exception: pass
+
+        manifest = doc_registry.build_manifest(zf, run_id, manifest_docs, company=full_company_name, style=selected_style)
+        doc_registry.write_manifest(zf, manifest)
     progress.progress(100)
+
+    if fuzzy_duties:
+        st.info("ℹ️ Обязанности взяты из инструкции похожей должности, проверьте:\n\n" + "\n".join(f"- {f}" for f in fuzzy_duties))
+    if ai_failures:
+        st.warning("⚠️ Обязанности не сгенерированы (поле оставлено пустым):\n\n" + "\n".join(f"- {f}" for f in ai_failures))
     
     if files_ok > 0:
+        try:
+            doc_registry.save_run(manifest, zip_buf.getvalue())
+        except Exception as e:
+            st.warning(f"⚠️ Архив не сохранен в реестр: {e}")
         zip_buf.seek(0)
-        st.success(f"✅ Файлов создано: {files_ok}")
+        st.success(f"✅ Файлов создано: {files_ok} (№ {doc_numbers[0]} - {doc_numbers[-1]})")
         st.download_button("💾 Скачать ZIP", zip_buf, f"Docs_{date.today()}.zip", "application/zip")
     else:
         st.error("Шаблоны не найдены!")
\ No newline at end of file